@@ -1,10 +1,20 @@
 # app/ai.py
 import os
-import json
+import io
+import asyncio
+import logging
 import base64
+from collections import OrderedDict
 from typing import Dict, Any
 
-from app.config import OPENAI_API_KEY, VALID_KINDS
+from app.config import AI_CACHE_SIZE, OPENAI_API_KEY, VALID_KINDS
+
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+logger = logging.getLogger(__name__)
 
 AI_TEXT_PROMPT = """
 Ты помощник телеграм-бота учета еды.
@@ -72,39 +82,122 @@ AI_PHOTO_PROMPT_ING = """
 - если не уверен: items=[]
 """
 
+# System messages are built once and shared by every request
+_TEXT_SYSTEM_MSG = {"role": "system", "content": AI_TEXT_PROMPT}
+_PHOTO_SYSTEM_MSG = {
+    "meal": {"role": "system", "content": AI_PHOTO_PROMPT_MEAL},
+    "ingredient": {"role": "system", "content": AI_PHOTO_PROMPT_ING},
+}
+
+# Structured output: the API guarantees the reply matches this schema
+AI_RESPONSE_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "bot_cmd",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "action": {"type": "string", "enum": ["add", "delete", "unknown"]},
+                "kind": {"type": "string", "enum": ["meal", "ingredient"]},
+                "place": {"type": "string", "enum": ["fridge", "kitchen", "freezer"]},
+                "items": {"type": "array", "items": {"type": "string"}},
+            },
+            "required": ["action", "kind", "place", "items"],
+            "additionalProperties": False,
+        },
+    }
+}
+
+
+PHOTO_MAX_SIDE = 1024
+PHOTO_JPEG_QUALITY = 80
+
+
+def _shrink_photo(buf: io.BytesIO) -> memoryview:
+    """Downscale to PHOTO_MAX_SIDE and re-encode as JPEG; vision doesn't need more."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return buf.getbuffer()
+    try:
+        buf.seek(0)
+        img = Image.open(buf)
+        img.thumbnail((PHOTO_MAX_SIDE, PHOTO_MAX_SIDE))
+        out = io.BytesIO()
+        img.convert("RGB").save(out, format="JPEG", quality=PHOTO_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        logger.warning("Photo shrink error: %s", e)
+        return buf.getbuffer()
+    return out.getbuffer()
+
+
+_OPENAI_CLIENT = None
+
 
 def _client():
+    """Shared async OpenAI client (keeps its HTTP connection pool warm across calls)."""
+    global _OPENAI_CLIENT
     if not OPENAI_API_KEY:
         return None
-    from openai import OpenAI
-    return OpenAI(api_key=OPENAI_API_KEY)
+    if _OPENAI_CLIENT is None:
+        from openai import AsyncOpenAI
+        _OPENAI_CLIENT = AsyncOpenAI(api_key=OPENAI_API_KEY)
+    return _OPENAI_CLIENT
+
+
+# LRU of lowercased, whitespace-collapsed text -> raw model output (lru_cache can't wrap coroutines).
+# Not norm(): its ъ/ь/ё folding would merge different words such as "съели" and "сели".
+_TEXT_CACHE: "OrderedDict[str, str]" = OrderedDict()
 
 
-def ai_parse_text(text: str) -> Dict[str, Any]:
+async def _ai_parse_text_json(key: str, text: str) -> Dict[str, Any]:
+    """
+    Parsed model output for text, cached under key.
+    Only complete, non-empty, parseable output is cached; failures raise and are retried next time.
+    """
+    raw = _TEXT_CACHE.get(key)
+    if raw is not None:
+        _TEXT_CACHE.move_to_end(key)
+        return json_loads(raw)
+
+    client = _client()
+    resp = await client.responses.create(
+        model="gpt-4o-mini",
+        input=[
+            _TEXT_SYSTEM_MSG,
+            {"role": "user", "content": text},
+        ],
+        max_output_tokens=250,
+        text=AI_RESPONSE_FORMAT,
+    )
+    raw = (resp.output_text or "").strip()
+    logger.debug("AI text raw: %s", raw)
+    if not raw:
+        return {"action": "unknown"}
+    parsed = json_loads(raw)
+    # Incomplete responses (e.g. cut off at max_output_tokens) are returned but never cached
+    if resp.status == "completed":
+        _TEXT_CACHE[key] = raw
+        if len(_TEXT_CACHE) > AI_CACHE_SIZE:
+            _TEXT_CACHE.popitem(last=False)
+    return parsed
+
+
+async def ai_parse_text(text: str) -> Dict[str, Any]:
     """
     Parse free text into action JSON.
     Uses gpt-4o-mini for reliability.
+    Repeats differing only in case or spacing are served from an in-memory cache;
+    the model always sees the text as typed.
     """
-    client = _client()
-    if client is None:
+    if not OPENAI_API_KEY:
         return {"action": "unknown"}
 
     try:
-        resp = client.responses.create(
-            model="gpt-4o-mini",
-            input=[
-                {"role": "system", "content": AI_TEXT_PROMPT},
-                {"role": "user", "content": text},
-            ],
-            max_output_tokens=250,
-        )
-        raw = (resp.output_text or "").strip()
-        print("AI text raw:", raw)
-        if not raw:
-            return {"action": "unknown"}
-        return json.loads(raw)
+        return await _ai_parse_text_json(" ".join(text.lower().split()), text.strip())
     except Exception as e:
-        print("AI text error:", e)
+        logger.warning("AI text error: %s", e)
         return {"action": "unknown"}
 
 
@@ -127,17 +220,18 @@ async def ai_parse_photo(update, context, kind: str) -> Dict[str, Any]:
 
         photo = update.message.photo[-1]
         file = await context.bot.get_file(photo.file_id)
-        data_bytes = await file.download_as_bytearray()
+        buf = io.BytesIO()
+        await file.download_to_memory(out=buf)
+        # Pillow decode/encode is CPU-bound; keep it off the event loop
+        data = await asyncio.to_thread(_shrink_photo, buf)
 
-        b64 = base64.b64encode(bytes(data_bytes)).decode("ascii")
+        b64 = base64.b64encode(data).decode("ascii")
         data_url = f"data:image/jpeg;base64,{b64}"
 
-        prompt = AI_PHOTO_PROMPT_MEAL if kind == "meal" else AI_PHOTO_PROMPT_ING
-
-        resp = client.responses.create(
+        resp = await client.responses.create(
             model="gpt-4o-mini",
             input=[
-                {"role": "system", "content": prompt},
+                _PHOTO_SYSTEM_MSG[kind],
                 {
                     "role": "user",
                     "content": [
@@ -147,14 +241,15 @@ async def ai_parse_photo(update, context, kind: str) -> Dict[str, Any]:
                 },
             ],
             max_output_tokens=300,
+            text=AI_RESPONSE_FORMAT,
         )
 
         raw = (resp.output_text or "").strip()
-        print("AI photo raw:", raw)
+        logger.debug("AI photo raw: %s", raw)
         if not raw:
             return {"action": "add", "kind": kind, "place": "fridge", "items": []}
 
-        parsed = json.loads(raw)
+        parsed = json_loads(raw)
 
         items = parsed.get("items", [])
         if isinstance(items, str):
@@ -169,5 +264,5 @@ async def ai_parse_photo(update, context, kind: str) -> Dict[str, Any]:
         return {"action": "add", "kind": kind, "place": "fridge", "items": items}
 
     except Exception as e:
-        print("AI photo error:", e)
+        logger.warning("AI photo error: %s", e)
         return {"action": "add", "kind": kind, "place": "fridge", "items": []}
@@ -3,13 +3,36 @@ from zoneinfo import ZoneInfo
 
 BOT_TOKEN = os.environ["BOT_TOKEN"]
 OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "").strip()
+AI_CACHE_SIZE = int(os.environ.get("AI_CACHE_SIZE", "1024").strip())
 DATABASE_URL = os.environ.get("DATABASE_URL", "").strip()
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").strip().upper()
+# Webhook mode is used when WEBHOOK_URL (public base URL) is set; otherwise long polling
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL", "").strip().rstrip("/")
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET", "").strip() or None
+PORT = int(os.environ.get("PORT", "8443").strip())
 SQLITE_PATH = "fridge.db"
+# Postgres pool sizing; override via PG_POOL_MIN / PG_POOL_MAX
+PG_POOL_MIN = int(os.environ.get("PG_POOL_MIN", "2").strip())
+PG_POOL_MAX = int(os.environ.get("PG_POOL_MAX", "10").strip())
+# 0 prepares every statement on first use (the bot has a small fixed set of queries);
+# set PG_PREPARE_THRESHOLD=none behind a transaction-mode pgbouncer to disable prepares
+_PG_PREPARE_RAW = os.environ.get("PG_PREPARE_THRESHOLD", "0").strip().lower()
+PG_PREPARE_THRESHOLD = None if _PG_PREPARE_RAW in ("", "none") else int(_PG_PREPARE_RAW)
+# Max updates handled at once (PTB concurrent_updates); 1 restores strictly sequential processing.
+# Only different chats run in parallel: updates from one chat are always handled one at a time,
+# in arrival order, so multi-step flows never see their own state change mid-handler.
+# On Postgres the default is capped at PG_POOL_MAX so concurrent handlers never outnumber connections.
+_CONCURRENT_DEFAULT = min(16, PG_POOL_MAX) if DATABASE_URL else 16
+CONCURRENT_UPDATES = int(os.environ.get("CONCURRENT_UPDATES", str(_CONCURRENT_DEFAULT)).strip())
+# In-process db_list / db_list_all cache; set LIST_CACHE=0 if several bot processes share one database
+LIST_CACHE_ENABLED = os.environ.get("LIST_CACHE", "1").strip() != "0"
 
 TZ = ZoneInfo(os.environ.get("TZ", "Europe/Moscow").strip())
 
-VALID_KINDS = ("meal", "ingredient")
-VALID_PLACES = ("fridge", "freezer", "kitchen")
+VALID_KINDS = frozenset({"meal", "ingredient"})
+VALID_PLACES = frozenset({"fridge", "freezer", "kitchen"})
+# Display order for places (VALID_PLACES is unordered)
+PLACE_ORDER = ("fridge", "freezer", "kitchen")
 
 MORNING_TZ = ZoneInfo(os.environ.get("MORNING_TZ", "Europe/Moscow").strip())
 MORNING_HOUR = int(os.environ.get("MORNING_HOUR", "8").strip())
@@ -1,12 +1,23 @@
 # app/db.py
 import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import wraps
 from datetime import datetime
-from typing import List, Tuple, Dict, Union
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterator, List, Tuple, Dict, Optional, Union
 
 from app.config import (
     DATABASE_URL,
+    PG_POOL_MIN,
+    PG_POOL_MAX,
+    PG_PREPARE_THRESHOLD,
     SQLITE_PATH,
     TZ,
+    LIST_CACHE_ENABLED,
+    PLACE_ORDER,
+    VALID_KINDS,
     VALID_PLACES,
 )
 
@@ -14,7 +25,78 @@ from app.config import (
 PG_POOL = None
 if DATABASE_URL:
     from psycopg_pool import ConnectionPool
-    PG_POOL = ConnectionPool(DATABASE_URL, min_size=1, max_size=5, timeout=10)
+    PG_POOL = ConnectionPool(
+        DATABASE_URL,
+        min_size=PG_POOL_MIN,
+        max_size=PG_POOL_MAX,
+        timeout=10,
+        kwargs={"prepare_threshold": PG_PREPARE_THRESHOLD, "autocommit": False},
+    )
+
+# Per-connection SQLite tuning; journal_mode=WAL is persistent and set in db_init
+_SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=30000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-20000",
+)
+
+
+_SQLITE_CON: Optional[sqlite3.Connection] = None
+_SQLITE_LOCK = threading.RLock()
+
+
+@contextmanager
+def _sqlite() -> Iterator[sqlite3.Connection]:
+    """Shared long-lived SQLite connection; one user at a time, commit/rollback on exit."""
+    global _SQLITE_CON
+    with _SQLITE_LOCK:
+        if _SQLITE_CON is None:
+            con = sqlite3.connect(SQLITE_PATH, check_same_thread=False)
+            for pragma in _SQLITE_PRAGMAS:
+                con.execute(pragma)
+            _SQLITE_CON = con
+        with _SQLITE_CON:
+            yield _SQLITE_CON
+
+# In-process cache of db_list results per (kind, place) and db_list_all results per kind.
+# Any write clears both and bumps the generation, so a read that raced with a write never
+# stores stale rows.
+# Single-process only: disable with LIST_CACHE=0 when several bot processes share the DB.
+_LIST_CACHE: Dict[Tuple[str, str], list] = {}
+_LIST_ALL_CACHE: Dict[str, dict] = {}
+_LIST_CACHE_GEN = 0
+_LIST_CACHE_LOCK = threading.Lock()
+
+
+def _invalidate_lists() -> None:
+    global _LIST_CACHE_GEN
+    with _LIST_CACHE_LOCK:
+        _LIST_CACHE_GEN += 1
+        _LIST_CACHE.clear()
+        _LIST_ALL_CACHE.clear()
+
+
+def _invalidates_lists(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _invalidate_lists()
+    return wrapper
+
+
+# Serves db_list / db_list_all filters and their ORDER BY straight from the index
+_ITEMS_LIST_INDEX = (
+    "CREATE INDEX IF NOT EXISTS idx_items_kind_place_created "
+    "ON items(kind, place, created_at, id)"
+)
+# Postgres variant also carries text, so db_list can be an index-only scan
+_ITEMS_LIST_INDEX_PG = (
+    "CREATE INDEX IF NOT EXISTS idx_items_kind_place_created_cov "
+    "ON items(kind, place, created_at, id) INCLUDE (text)"
+)
 
 
 def db_init() -> None:
@@ -33,9 +115,12 @@ def db_init() -> None:
                     )
                     """
                 )
+                cur.execute(_ITEMS_LIST_INDEX_PG)
             con.commit()
     else:
-        with sqlite3.connect(SQLITE_PATH) as con:
+        with _sqlite() as con:
+            if SQLITE_PATH != ":memory:":
+                con.execute("PRAGMA journal_mode=WAL")
             con.execute(
                 """
                 CREATE TABLE IF NOT EXISTS items (
@@ -47,37 +132,79 @@ def db_init() -> None:
                 )
                 """
             )
+            con.execute(_ITEMS_LIST_INDEX)
             con.commit()
 
 
-def db_add(kind: str, place: str, text: str) -> None:
-    now = datetime.now(tz=TZ)
-    text = (text or "").strip()
-    if not text:
+def db_close() -> None:
+    """Close the shared SQLite connection / Postgres pool (on shutdown)."""
+    global _SQLITE_CON
+    if PG_POOL:
+        PG_POOL.close()
         return
+    with _SQLITE_LOCK:
+        if _SQLITE_CON is not None:
+            _SQLITE_CON.close()
+            _SQLITE_CON = None
+
+
+def db_optimize() -> None:
+    """Refresh SQLite planner statistics; Postgres relies on autovacuum/autoanalyze."""
+    if PG_POOL:
+        return
+    with _sqlite() as con:
+        con.execute("PRAGMA optimize")
+
+
+@_invalidates_lists
+def db_add_many(kind: str, place: str, texts: List[str]) -> int:
+    """Insert several rows in one transaction. Returns number of rows added."""
+    now = datetime.now(tz=TZ)
+    texts = [t.strip() for t in texts if t and t.strip()]
+    if not texts:
+        return 0
 
     if PG_POOL:
         with PG_POOL.connection() as con:
-            with con.cursor() as cur:
-                cur.execute(
+            with con.pipeline(), con.cursor() as cur:
+                cur.executemany(
                     "INSERT INTO items(kind, place, text, created_at) VALUES (%s,%s,%s,%s)",
-                    (kind, place, text, now),
+                    [(kind, place, t, now) for t in texts],
                 )
             con.commit()
     else:
-        with sqlite3.connect(SQLITE_PATH) as con:
-            con.execute(
+        now_s = now.isoformat(timespec="seconds")
+        with _sqlite() as con:
+            con.executemany(
                 "INSERT INTO items(kind, place, text, created_at) VALUES (?,?,?,?)",
-                (kind, place, text, now.isoformat(timespec="seconds")),
+                [(kind, place, t, now_s) for t in texts],
             )
             con.commit()
+    return len(texts)
 
 
 DbDateValue = Union[str, datetime]
 
 
 def db_list(kind: str, place: str) -> List[Tuple[int, str, DbDateValue]]:
-    """Rows for one (kind, place) ordered by created_at."""
+    """Rows for one (kind, place) ordered by created_at; served from _LIST_CACHE when warm."""
+    cacheable = LIST_CACHE_ENABLED and kind in VALID_KINDS and place in VALID_PLACES
+    if not cacheable:
+        return _db_list_query(kind, place)
+
+    key = (kind, place)
+    with _LIST_CACHE_LOCK:
+        rows = _LIST_CACHE.get(key)
+        gen = _LIST_CACHE_GEN
+    if rows is None:
+        rows = _db_list_query(kind, place)
+        with _LIST_CACHE_LOCK:
+            if gen == _LIST_CACHE_GEN:
+                _LIST_CACHE[key] = rows
+    return list(rows)
+
+
+def _db_list_query(kind: str, place: str) -> List[Tuple[int, str, DbDateValue]]:
     if PG_POOL:
         with PG_POOL.connection() as con:
             with con.cursor() as cur:
@@ -88,7 +215,7 @@ def db_list(kind: str, place: str) -> List[Tuple[int, str, DbDateValue]]:
                 )
                 return [(int(a), str(b), c) for a, b, c in cur.fetchall()]
 
-    with sqlite3.connect(SQLITE_PATH) as con:
+    with _sqlite() as con:
         cur = con.execute(
             "SELECT id, text, created_at FROM items WHERE kind=? AND place=? "
             "ORDER BY created_at ASC, id ASC",
@@ -98,30 +225,50 @@ def db_list(kind: str, place: str) -> List[Tuple[int, str, DbDateValue]]:
 
 
 def db_list_all(kind: str) -> Dict[str, List[Tuple[int, str, DbDateValue]]]:
-    """All rows for kind grouped by place."""
+    """All rows for kind grouped by place; served from _LIST_ALL_CACHE when warm."""
+    if not (LIST_CACHE_ENABLED and kind in VALID_KINDS):
+        return _db_list_all_query(kind)
+
+    with _LIST_CACHE_LOCK:
+        grouped = _LIST_ALL_CACHE.get(kind)
+        gen = _LIST_CACHE_GEN
+    if grouped is None:
+        grouped = _db_list_all_query(kind)
+        with _LIST_CACHE_LOCK:
+            if gen == _LIST_CACHE_GEN:
+                _LIST_ALL_CACHE[kind] = grouped
+    return {place: list(rows) for place, rows in grouped.items()}
+
+
+def _db_list_all_query(kind: str) -> Dict[str, List[Tuple[int, str, DbDateValue]]]:
+    out: Dict[str, List[Tuple[int, str, DbDateValue]]] = {p: [] for p in PLACE_ORDER}
+
     if PG_POOL:
+        # One row per place: parallel arrays aggregated server-side
         with PG_POOL.connection() as con:
             with con.cursor() as cur:
                 cur.execute(
-                    "SELECT place, id, text, created_at FROM items WHERE kind=%s "
-                    "ORDER BY place ASC, created_at ASC, id ASC",
+                    "SELECT place, "
+                    "array_agg(id ORDER BY created_at, id), "
+                    "array_agg(text ORDER BY created_at, id), "
+                    "array_agg(created_at ORDER BY created_at, id) "
+                    "FROM items WHERE kind=%s GROUP BY place",
                     (kind,),
                 )
-                rows = cur.fetchall()
-    else:
-        with sqlite3.connect(SQLITE_PATH) as con:
-            cur = con.execute(
-                "SELECT place, id, text, created_at FROM items WHERE kind=? "
-                "ORDER BY place ASC, created_at ASC, id ASC",
-                (kind,),
-            )
-            rows = cur.fetchall()
+                for place, ids, texts, dates in cur.fetchall():
+                    if place in out:
+                        out[place] = list(zip(ids, texts, dates))
+        return out
 
-    out: Dict[str, List[Tuple[int, str, DbDateValue]]] = {p: [] for p in VALID_PLACES}
-    for place, item_id, text, created_at in rows:
-        p = str(place)
-        if p in out:
-            out[p].append((int(item_id), str(text), created_at))
+    with _sqlite() as con:
+        cur = con.execute(
+            "SELECT place, id, text, created_at FROM items WHERE kind=? "
+            "ORDER BY place ASC, created_at ASC, id ASC",
+            (kind,),
+        )
+        for place, grp in groupby(cur, key=itemgetter(0)):
+            if place in out:
+                out[place] = [(item_id, text, created_at) for _p, item_id, text, created_at in grp]
     return out
 
 
@@ -137,7 +284,7 @@ def db_list_place(place: str) -> List[Tuple[str, str, DbDateValue]]:
                 )
                 return [(str(a), str(b), c) for a, b, c in cur.fetchall()]
 
-    with sqlite3.connect(SQLITE_PATH) as con:
+    with _sqlite() as con:
         cur = con.execute(
             "SELECT kind, text, created_at FROM items WHERE place=? "
             "ORDER BY created_at ASC, id ASC",
@@ -146,16 +293,32 @@ def db_list_place(place: str) -> List[Tuple[str, str, DbDateValue]]:
         return [(str(a), str(b), str(c)) for a, b, c in cur.fetchall()]
 
 
-def db_all_raw() -> List[Tuple[int, str, str, str]]:
-    """All rows for AI delete matching: (id, kind, place, text)."""
+def db_list_filtered(
+    kind: Optional[str] = None, place: Optional[str] = None
+) -> List[Tuple[int, str, str, str]]:
+    """Rows for AI delete matching, optionally narrowed by kind/place: (id, kind, place, text)."""
+    ph = "%s" if PG_POOL else "?"
+    where = []
+    params = []
+    if kind:
+        where.append(f"kind={ph}")
+        params.append(kind)
+    if place:
+        where.append(f"place={ph}")
+        params.append(place)
+    sql = "SELECT id, kind, place, text FROM items"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY id"
+
     if PG_POOL:
         with PG_POOL.connection() as con:
             with con.cursor() as cur:
-                cur.execute("SELECT id, kind, place, text FROM items ORDER BY id")
+                cur.execute(sql, params)
                 return [(int(a), str(b), str(c), str(d)) for a, b, c, d in cur.fetchall()]
 
-    with sqlite3.connect(SQLITE_PATH) as con:
-        cur = con.execute("SELECT id, kind, place, text FROM items ORDER BY id")
+    with _sqlite() as con:
+        cur = con.execute(sql, params)
         return [(int(a), str(b), str(c), str(d)) for a, b, c, d in cur.fetchall()]
 
 
@@ -167,23 +330,33 @@ def db_all_raw_with_date() -> List[Tuple[int, str, str, str, DbDateValue]]:
                 cur.execute("SELECT id, kind, place, text, created_at FROM items ORDER BY id")
                 return [(int(a), str(b), str(c), str(d), e) for a, b, c, d, e in cur.fetchall()]
 
-    with sqlite3.connect(SQLITE_PATH) as con:
+    with _sqlite() as con:
         cur = con.execute("SELECT id, kind, place, text, created_at FROM items ORDER BY id")
         return [(int(a), str(b), str(c), str(d), str(e)) for a, b, c, d, e in cur.fetchall()]
 
 
-def db_delete(item_id: int) -> None:
+@_invalidates_lists
+def db_delete_many(item_ids: List[int]) -> int:
+    """Delete several rows in one statement. Returns number of rows deleted."""
+    ids = [int(x) for x in item_ids]
+    if not ids:
+        return 0
     if PG_POOL:
         with PG_POOL.connection() as con:
             with con.cursor() as cur:
-                cur.execute("DELETE FROM items WHERE id=%s", (item_id,))
-            con.commit()
-    else:
-        with sqlite3.connect(SQLITE_PATH) as con:
-            con.execute("DELETE FROM items WHERE id=?", (item_id,))
+                cur.execute("DELETE FROM items WHERE id = ANY(%s)", (ids,))
+                deleted = cur.rowcount
             con.commit()
+        return deleted
+
+    placeholders = ",".join("?" * len(ids))
+    with _sqlite() as con:
+        cur = con.execute(f"DELETE FROM items WHERE id IN ({placeholders})", ids)
+        con.commit()
+        return cur.rowcount
 
 
+@_invalidates_lists
 def db_update_text(item_id: int, text: str) -> None:
     text = (text or "").strip()
     if not text:
@@ -194,11 +367,12 @@ def db_update_text(item_id: int, text: str) -> None:
                 cur.execute("UPDATE items SET text=%s WHERE id=%s", (text, item_id))
             con.commit()
     else:
-        with sqlite3.connect(SQLITE_PATH) as con:
+        with _sqlite() as con:
             con.execute("UPDATE items SET text=? WHERE id=?", (text, item_id))
             con.commit()
 
 
+@_invalidates_lists
 def db_update_created_at(item_id: int, created_at: datetime) -> None:
     if PG_POOL:
         with PG_POOL.connection() as con:
@@ -206,7 +380,7 @@ def db_update_created_at(item_id: int, created_at: datetime) -> None:
                 cur.execute("UPDATE items SET created_at=%s WHERE id=%s", (created_at, item_id))
             con.commit()
     else:
-        with sqlite3.connect(SQLITE_PATH) as con:
+        with _sqlite() as con:
             con.execute(
                 "UPDATE items SET created_at=? WHERE id=?",
                 (created_at.isoformat(timespec="seconds"), item_id),
@@ -214,19 +388,28 @@ def db_update_created_at(item_id: int, created_at: datetime) -> None:
             con.commit()
 
 
-def db_update_place_and_date(item_id: int, place: str, created_at: datetime) -> None:
+@_invalidates_lists
+def db_move_many(item_ids: List[int], place: str, created_at: datetime) -> int:
+    """Set place and created_at for several rows in one statement. Returns rows updated."""
+    ids = [int(x) for x in item_ids]
+    if not ids:
+        return 0
     if PG_POOL:
         with PG_POOL.connection() as con:
             with con.cursor() as cur:
                 cur.execute(
-                    "UPDATE items SET place=%s, created_at=%s WHERE id=%s",
-                    (place, created_at, item_id),
+                    "UPDATE items SET place=%s, created_at=%s WHERE id = ANY(%s)",
+                    (place, created_at, ids),
                 )
+                updated = cur.rowcount
             con.commit()
-    else:
-        with sqlite3.connect(SQLITE_PATH) as con:
-            con.execute(
-                "UPDATE items SET place=?, created_at=? WHERE id=?",
-                (place, created_at.isoformat(timespec="seconds"), item_id),
-            )
-            con.commit()
+        return updated
+
+    placeholders = ",".join("?" * len(ids))
+    with _sqlite() as con:
+        cur = con.execute(
+            f"UPDATE items SET place=?, created_at=? WHERE id IN ({placeholders})",
+            [place, created_at.isoformat(timespec="seconds"), *ids],
+        )
+        con.commit()
+        return cur.rowcount
@@ -1,11 +1,15 @@
+import asyncio
 from datetime import datetime, time
+from functools import lru_cache
+import logging
 import random
-from typing import List, Tuple, Union
+from typing import Dict, List, Tuple, Union
 
 from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     CallbackQueryHandler,
     MessageHandler,
@@ -18,6 +22,7 @@ from app.config import (
     OPENAI_API_KEY,
     VALID_KINDS,
     VALID_PLACES,
+    PLACE_ORDER,
     KIND_LABEL,
     PLACE_LABEL,
     TZ,
@@ -31,6 +36,7 @@ from app.config import (
     EVENING_HOUR,
     EVENING_MINUTE,
     ADMIN_IDS,
+    CONCURRENT_UPDATES,
 )
 from app.ui import (
     kb_main,
@@ -51,16 +57,18 @@ from app.utils import (
 )
 from app.db import (
     db_init,
-    db_add,
+    db_close,
+    db_optimize,
+    db_add_many,
     db_list,
     db_list_all,
     db_list_place,
-    db_all_raw,
+    db_list_filtered,
     db_all_raw_with_date,
-    db_delete,
+    db_delete_many,
     db_update_text,
     db_update_created_at,
-    db_update_place_and_date,
+    db_move_many,
 )
 from app.ai import (
     ai_parse_text,
@@ -68,6 +76,8 @@ from app.ai import (
 )
 from app.welcome import WELCOME_TEXT
 
+logger = logging.getLogger(__name__)
+
 
 DbDateValue = Union[str, datetime]
 
@@ -85,17 +95,32 @@ def _fmt_date(value: DbDateValue) -> str:
     return dt.strftime("%d.%m.%Y")
 
 
+def _fmt_row(i: int, text: str, created_at: DbDateValue) -> str:
+    date_str = _fmt_date(created_at)
+    if date_str:
+        return f"<b>{i}.</b> {esc(text)} — {date_str}"
+    return f"<b>{i}.</b> {esc(text)}"
+
+
+def _fmt_found_row(kind: str, place: str, text: str, created_at: DbDateValue) -> str:
+    date_str = _fmt_date(created_at)
+    extra = f" — {date_str}" if date_str else ""
+    return f"• {esc(text)} — {PLACE_LABEL.get(place, place)} — {KIND_LABEL.get(kind, kind)}{extra}"
+
+
 def fmt_rows(rows: List[Tuple[int, str, DbDateValue]]) -> str:
     if not rows:
         return "— (пусто)"
-    out = []
-    for i, (_id, text, created_at) in enumerate(rows, start=1):
-        date_str = _fmt_date(created_at)
-        if date_str:
-            out.append(f"<b>{i}.</b> {esc(text)} — {date_str}")
-        else:
-            out.append(f"<b>{i}.</b> {esc(text)}")
-    return "\n".join(out)
+    return _fmt_rows_cached(tuple(rows))
+
+
+# Keyed on the row contents themselves, so any add/delete/edit naturally misses
+@lru_cache(maxsize=64)
+def _fmt_rows_cached(rows: Tuple[Tuple[int, str, DbDateValue], ...]) -> str:
+    return "\n".join(
+        _fmt_row(i, text, created_at)
+        for i, (_id, text, created_at) in enumerate(rows, start=1)
+    )
 
 
 def _coerce_dt(value: DbDateValue) -> datetime | None:
@@ -155,7 +180,7 @@ def _build_morning_message(items: List[Tuple[str, str, DbDateValue]]) -> str:
 async def morning_job(context: ContextTypes.DEFAULT_TYPE):
     if not MORNING_CHAT_ID:
         return
-    items = db_list_place("fridge")
+    items = await asyncio.to_thread(db_list_place, "fridge")
     msg = _build_morning_message(items)
     await context.bot.send_message(
         chat_id=MORNING_CHAT_ID,
@@ -164,10 +189,18 @@ async def morning_job(context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+async def _on_shutdown(app: Application) -> None:
+    await asyncio.to_thread(db_close)
+
+
+async def db_optimize_job(context: ContextTypes.DEFAULT_TYPE):
+    await asyncio.to_thread(db_optimize)
+
+
 async def evening_job(context: ContextTypes.DEFAULT_TYPE):
     if not EVENING_CHAT_ID:
         return
-    items = db_list_place("fridge")
+    items = await asyncio.to_thread(db_list_place, "fridge")
     msg = _build_evening_message(items)
     await context.bot.send_message(
         chat_id=EVENING_CHAT_ID,
@@ -228,6 +261,28 @@ def _is_private(update: Update) -> bool:
     return bool(chat and chat.type == "private")
 
 
+# Every user_data key a flow may set; reset pops only these instead of clear()
+_FLOW_KEYS = (
+    "act",
+    "kind",
+    "place",
+    "del_ids",
+    "edit_ids",
+    "edit_field",
+    "move_ids",
+    "move_from",
+    "move_to",
+    "photo_mode",
+    "photo_kind",
+    "pending_photo",
+)
+
+
+def _reset_flow(user_data) -> None:
+    for key in _FLOW_KEYS:
+        user_data.pop(key, None)
+
+
 def _main_kb(update: Update):
     return kb_main(_is_admin(update))
 
@@ -239,26 +294,40 @@ def _parse_ddmmyyyy(value: str) -> datetime | None:
         return None
     return dt.replace(tzinfo=TZ)
 
-def find_matches(rows: List[Tuple[int, str, str, str]], query: str):
+MATCH_CAP = 20
+
+
+def find_matches_many(rows: List[Tuple[int, str, str, str]], queries: List[str]):
     """
     rows: (id, kind, place, text)
-    query: e.g. "суп"
-    returns list of (id, text)
+    queries: e.g. ["суп", "молоко"]
+    Row texts are normalized once and exact matches are a dict lookup instead of a scan per query.
+    returns one list of (id, text) per query, in order: exact matches if any,
+    else up to MATCH_CAP substring matches
     """
-    q = norm(query)
-    if not q:
-        return []
-
-    exact = [(item_id, t) for (item_id, _k, _p, t) in rows if norm(t) == q]
-    if exact:
-        return exact
+    normed = [(item_id, t, norm(t)) for (item_id, _k, _p, t) in rows]
+    by_norm: Dict[str, List[Tuple[int, str]]] = {}
+    for item_id, t, tt in normed:
+        by_norm.setdefault(tt, []).append((item_id, t))
 
-    subs = []
-    for (item_id, _k, _p, t) in rows:
-        tt = norm(t)
-        if q in tt or tt in q:
-            subs.append((item_id, t))
-    return subs
+    out = []
+    for query in queries:
+        q = norm(query)
+        if not q:
+            out.append([])
+            continue
+        exact = by_norm.get(q)
+        if exact:
+            out.append(list(exact))
+            continue
+        subs = []
+        for item_id, t, tt in normed:
+            if q in tt or tt in q:
+                subs.append((item_id, t))
+                if len(subs) >= MATCH_CAP:
+                    break
+        out.append(subs)
+    return out
 
 
 def _extract_query(text: str) -> str:
@@ -296,26 +365,25 @@ def _find_query_matches(rows: List[Tuple[int, str, str, str, DbDateValue]], quer
     if not q:
         return []
 
-    exact = [r for r in rows if norm(r[3]) == q]
-    if exact:
-        return exact
-
+    exact = []
     subs = []
     for r in rows:
         tt = norm(r[3])
-        if q in tt or tt in q:
+        if tt == q:
+            exact.append(r)
+        elif not exact and len(subs) < MATCH_CAP and (q in tt or tt in q):
             subs.append(r)
-    return subs
+    return exact or subs
 
 
 # ================= COMMANDS =================
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data.clear()
+    _reset_flow(context.user_data)
     await update.message.reply_text(WELCOME_TEXT, reply_markup=_main_kb(update))
 
 
 async def cancel_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    context.user_data.clear()
+    _reset_flow(context.user_data)
     await update.message.reply_text(WELCOME_TEXT, reply_markup=_main_kb(update))
 
 
@@ -325,7 +393,7 @@ async def env_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def ai_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    res = ai_parse_text("Добавь молоко и яйца в холодильник")
+    res = await ai_parse_text("Добавь молоко и яйца в холодильник")
     await update.message.reply_text(f"AI_TEST: {res}")
 
 
@@ -336,7 +404,7 @@ async def edit_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not _is_admin(update):
         await update.message.reply_text("Недостаточно прав.")
         return
-    context.user_data.clear()
+    _reset_flow(context.user_data)
     context.user_data["act"] = "edit"
     await update.message.reply_text("Выбери категорию:", reply_markup=kb_kind("edit"))
 
@@ -345,7 +413,7 @@ async def morning_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not MORNING_CHAT_ID:
         await update.message.reply_text("MORNING_CHAT_ID не задан.")
         return
-    items = db_list_place("fridge")
+    items = await asyncio.to_thread(db_list_place, "fridge")
     msg = _build_morning_message(items)
     try:
         await context.bot.send_message(
@@ -363,7 +431,7 @@ async def evening_test(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not EVENING_CHAT_ID:
         await update.message.reply_text("EVENING_CHAT_ID не задан.")
         return
-    items = db_list_place("fridge")
+    items = await asyncio.to_thread(db_list_place, "fridge")
     msg = _build_evening_message(items)
     try:
         await context.bot.send_message(
@@ -391,7 +459,8 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
     await q.answer()
     data = q.data
-    if data.startswith("act:edit") or data.startswith("edit:"):
+    parts = data.split(":")
+    if parts[0] == "edit" or parts[:2] == ["act", "edit"]:
         if not _is_private(update):
             await q.edit_message_text("Редактирование доступно только в личке.", reply_markup=_main_kb(update))
             return
@@ -399,212 +468,201 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await q.edit_message_text("Недостаточно прав.", reply_markup=_main_kb(update))
             return
 
-    # ---- Global nav
-    if data == "nav:main":
-        context.user_data.clear()
-        await q.edit_message_text(WELCOME_TEXT, reply_markup=_main_kb(update))
-        return
+    match parts:
+        # ---- Global nav
+        case ["nav", "main"]:
+            _reset_flow(context.user_data)
+            await q.edit_message_text(WELCOME_TEXT, reply_markup=_main_kb(update))
+            return
 
-    if data == "nav:cancel":
-        context.user_data.clear()
-        await q.edit_message_text(WELCOME_TEXT, reply_markup=_main_kb(update))
-        return
+        case ["nav", "cancel"]:
+            _reset_flow(context.user_data)
+            await q.edit_message_text(WELCOME_TEXT, reply_markup=_main_kb(update))
+            return
 
-    # ---- Photo flow entry
-    if data == "act:photo":
-        # Если мы были в ожидании фото — тоже возвращаемся сюда
-        context.user_data.clear()
-        context.user_data["photo_mode"] = "choose_kind"
-        await q.edit_message_text("Фото-распознавание: выбери тип:", reply_markup=kb_photo_kind())
-        return
+        # ---- Photo flow entry
+        case ["act", "photo"]:
+            # Если мы были в ожидании фото — тоже возвращаемся сюда
+            _reset_flow(context.user_data)
+            context.user_data["photo_mode"] = "choose_kind"
+            await q.edit_message_text("Фото-распознавание: выбери тип:", reply_markup=kb_photo_kind())
+            return
 
-    # ---- Photo kind selected
-    if data.startswith("photo:kind:"):
-        _, _, kind = data.split(":")
-        if kind not in VALID_KINDS:
-            kind = "ingredient"
-        context.user_data.clear()
-        context.user_data["photo_mode"] = "wait_photo"
-        context.user_data["photo_kind"] = kind
-
-        # ВАЖНО: здесь показываем ТОЛЬКО "Назад"
-        await q.edit_message_text(
-            f"Ок. Тип: <b>{KIND_LABEL[kind]}</b>\n\n"
-            f"Теперь пришли <b>фото</b> одним сообщением.",
-            parse_mode=ParseMode.HTML,
-            reply_markup=kb_photo_wait_back(),
-        )
-        return
+        # ---- Photo kind selected
+        case ["photo", "kind", kind]:
+            if kind not in VALID_KINDS:
+                kind = "ingredient"
+            _reset_flow(context.user_data)
+            context.user_data["photo_mode"] = "wait_photo"
+            context.user_data["photo_kind"] = kind
 
-    # ---- Photo confirm/cancel
-    if data == "photo:cancel":
-        # отмена подтверждения -> возвращаемся в меню
-        context.user_data.clear()
-        await q.edit_message_text(WELCOME_TEXT, reply_markup=_main_kb(update))
-        return
+            # ВАЖНО: здесь показываем ТОЛЬКО "Назад"
+            await q.edit_message_text(
+                f"Ок. Тип: <b>{KIND_LABEL[kind]}</b>\n\n"
+                f"Теперь пришли <b>фото</b> одним сообщением.",
+                parse_mode=ParseMode.HTML,
+                reply_markup=kb_photo_wait_back(),
+            )
+            return
 
-    if data == "photo:confirm":
-        pending = context.user_data.get("pending_photo")
-        if not pending:
-            context.user_data.clear()
+        # ---- Photo confirm/cancel
+        case ["photo", "cancel"]:
+            # отмена подтверждения -> возвращаемся в меню
+            _reset_flow(context.user_data)
             await q.edit_message_text(WELCOME_TEXT, reply_markup=_main_kb(update))
             return
 
-        kind = pending.get("kind", "ingredient")
-        place = pending.get("place", "fridge")
-        items = pending.get("items", [])
-
-        if kind not in VALID_KINDS:
-            kind = "ingredient"
-        if place not in VALID_PLACES:
-            place = "fridge"
-        if not isinstance(items, list):
-            items = []
-
-        added = 0
-        for it in items:
-            if isinstance(it, str) and it.strip():
-                db_add(kind, place, it.strip())
-                added += 1
-
-        context.user_data.clear()
-        await q.edit_message_text(
-            f"Добавил ✅ {added} шт. ({KIND_LABEL[kind]} → {PLACE_LABEL[place]})",
-            reply_markup=_main_kb(update),
-        )
-        return
-
-    # ---- Standard flows
-    if data.startswith("act:"):
-        act = data.split(":", 1)[1]  # add / del / show
-        context.user_data.clear()
-        context.user_data["act"] = act
-        await q.edit_message_text("Выбери категорию:", reply_markup=kb_kind(act))
-        return
-
-    if data.endswith(":back_kind"):
-        act = data.split(":")[0]
-        await q.edit_message_text("Выбери категорию:", reply_markup=kb_kind(act))
-        return
-
-    if data in ("add:back_place", "del:back_place"):
-        act = data.split(":")[0]
-        kind = context.user_data.get("kind", "ingredient")
-        await q.edit_message_text("Выбери место:", reply_markup=kb_place(act, kind))
-        return
+        case ["photo", "confirm"]:
+            pending = context.user_data.get("pending_photo")
+            if not pending:
+                _reset_flow(context.user_data)
+                await q.edit_message_text(WELCOME_TEXT, reply_markup=_main_kb(update))
+                return
 
-    if data == "move:back_place":
-        kind = context.user_data.get("kind", "ingredient")
-        await q.edit_message_text("Выбери место:", reply_markup=kb_place("move", kind))
-        return
+            kind = pending.get("kind", "ingredient")
+            place = pending.get("place", "fridge")
+            items = pending.get("items", [])
 
-    if data.startswith("move:dest:"):
-        _, _kw, kind, from_place, to_place = data.split(":")
-        context.user_data["act"] = "move"
-        context.user_data["kind"] = kind
-        context.user_data["move_from"] = from_place
-        context.user_data["move_to"] = to_place
-
-        rows = db_list(kind, from_place)
-        context.user_data["move_rows"] = rows
-        msg = (
-            f"Переложить: <b>{KIND_LABEL[kind]}</b> → "
-            f"<b>{PLACE_LABEL[from_place]}</b> → <b>{PLACE_LABEL[to_place]}</b>\n\n"
-            f"{fmt_rows(rows)}\n\n"
-            "Отправь номер(а) строк для переноса.\n"
-            "Примеры: <b>2</b> или <b>1 4</b> или <b>1, 4</b>\n"
-            "/cancel — отмена."
-        )
-        await q.edit_message_text(msg, parse_mode=ParseMode.HTML, reply_markup=_main_kb(update))
-        return
+            if kind not in VALID_KINDS:
+                kind = "ingredient"
+            if place not in VALID_PLACES:
+                place = "fridge"
+            if not isinstance(items, list):
+                items = []
 
-    if data == "edit:back_place":
-        kind = context.user_data.get("kind", "ingredient")
-        await q.edit_message_text("Выбери место:", reply_markup=kb_place("edit", kind))
-        return
+            added = await asyncio.to_thread(db_add_many, kind, place, [it for it in items if isinstance(it, str)])
 
-    if data.startswith("edit:field:"):
-        field = data.split(":")[-1]
-        context.user_data["edit_field"] = field
-        if field == "text":
+            _reset_flow(context.user_data)
             await q.edit_message_text(
-                "Отправь: номер и новое название.\nПример: <b>2 Паста карбонара</b>",
-                parse_mode=ParseMode.HTML,
-                reply_markup=kb_back("edit:back_place"),
+                f"Добавил ✅ {added} шт. ({KIND_LABEL[kind]} → {PLACE_LABEL[place]})",
+                reply_markup=_main_kb(update),
             )
             return
-        if field == "date":
-            await q.edit_message_text(
-                "Отправь: номер и новую дату в формате <b>дд.мм.гггг</b>.\nПример: <b>2 04.02.2026</b>",
-                parse_mode=ParseMode.HTML,
-                reply_markup=kb_back("edit:back_place"),
-            )
+
+        # ---- Standard flows
+        case ["act", act]:  # add / del / show
+            _reset_flow(context.user_data)
+            context.user_data["act"] = act
+            await q.edit_message_text("Выбери категорию:", reply_markup=kb_kind(act))
             return
 
-    if ":kind:" in data:
-        act, _kw, kind = data.split(":")
-        context.user_data["act"] = act
-        context.user_data["kind"] = kind
+        case [act, "back_kind"]:
+            await q.edit_message_text("Выбери категорию:", reply_markup=kb_kind(act))
+            return
 
-        if act in ("add", "del", "edit", "move"):
+        case [("add" | "del") as act, "back_place"]:
+            kind = context.user_data.get("kind", "ingredient")
             await q.edit_message_text("Выбери место:", reply_markup=kb_place(act, kind))
             return
 
-        if act == "show":
-            allp = db_list_all(kind)
-            blocks = []
-            for place in VALID_PLACES:
-                blocks.append(f"<b>{PLACE_LABEL[place]}</b>\n{fmt_rows(allp[place])}")
-            text = f"Остатки: <b>{KIND_LABEL[kind]}</b>\n\n" + "\n\n".join(blocks)
-            await q.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=_main_kb(update))
+        case ["move", "back_place"]:
+            kind = context.user_data.get("kind", "ingredient")
+            await q.edit_message_text("Выбери место:", reply_markup=kb_place("move", kind))
             return
 
-    if ":place:" in data:
-        act, _pkw, kind, place = data.split(":")
-        context.user_data["act"] = act
-        context.user_data["kind"] = kind
-        context.user_data["place"] = place
-
-        if act == "add":
-            await q.edit_message_text(
-                f"Добавление: <b>{KIND_LABEL[kind]}</b> → <b>{PLACE_LABEL[place]}</b>\n\n"
-                "Напиши названия одним сообщением.\n"
-                "Можно несколько строк:\nСуп\nРагу",
-                parse_mode=ParseMode.HTML,
-                reply_markup=kb_back("add:back_place"),
-            )
-            return
+        case ["move", "dest", kind, from_place, to_place]:
+            context.user_data["act"] = "move"
+            context.user_data["kind"] = kind
+            context.user_data["move_from"] = from_place
+            context.user_data["move_to"] = to_place
 
-        if act == "del":
-            rows = db_list(kind, place)
-            context.user_data["del_rows"] = rows
+            rows = await asyncio.to_thread(db_list, kind, from_place)
+            context.user_data["move_ids"] = tuple(r[0] for r in rows)
             msg = (
-                f"Удаление: <b>{KIND_LABEL[kind]}</b> → <b>{PLACE_LABEL[place]}</b>\n\n"
+                f"Переложить: <b>{KIND_LABEL[kind]}</b> → "
+                f"<b>{PLACE_LABEL[from_place]}</b> → <b>{PLACE_LABEL[to_place]}</b>\n\n"
                 f"{fmt_rows(rows)}\n\n"
-                "Отправь номер(а) строк для удаления.\n"
+                "Отправь номер(а) строк для переноса.\n"
                 "Примеры: <b>2</b> или <b>1 4</b> или <b>1, 4</b>\n"
                 "/cancel — отмена."
             )
-            await q.edit_message_text(msg, parse_mode=ParseMode.HTML, reply_markup=kb_back("del:back_place"))
+            await q.edit_message_text(msg, parse_mode=ParseMode.HTML, reply_markup=_main_kb(update))
             return
 
-        if act == "move":
-            await q.edit_message_text(
-                "Куда переложить?",
-                reply_markup=kb_move_dest(kind, place),
-            )
+        case ["edit", "back_place"]:
+            kind = context.user_data.get("kind", "ingredient")
+            await q.edit_message_text("Выбери место:", reply_markup=kb_place("edit", kind))
             return
 
-        if act == "edit":
-            rows = db_list(kind, place)
-            context.user_data["edit_rows"] = rows
-            msg = (
-                f"Редактирование: <b>{KIND_LABEL[kind]}</b> → <b>{PLACE_LABEL[place]}</b>\n\n"
-                f"{fmt_rows(rows)}\n\n"
-                "Что редактируем?"
-            )
-            await q.edit_message_text(msg, parse_mode=ParseMode.HTML, reply_markup=kb_edit_field())
-            return
+        case ["edit", "field", field]:
+            context.user_data["edit_field"] = field
+            if field == "text":
+                await q.edit_message_text(
+                    "Отправь: номер и новое название.\nПример: <b>2 Паста карбонара</b>",
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=kb_back("edit:back_place"),
+                )
+                return
+            if field == "date":
+                await q.edit_message_text(
+                    "Отправь: номер и новую дату в формате <b>дд.мм.гггг</b>.\nПример: <b>2 04.02.2026</b>",
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=kb_back("edit:back_place"),
+                )
+                return
+
+        case [act, "kind", kind]:
+            context.user_data["act"] = act
+            context.user_data["kind"] = kind
+
+            if act in ("add", "del", "edit", "move"):
+                await q.edit_message_text("Выбери место:", reply_markup=kb_place(act, kind))
+                return
+
+            if act == "show":
+                allp = await asyncio.to_thread(db_list_all, kind)
+                blocks = "\n\n".join(
+                    f"<b>{PLACE_LABEL[place]}</b>\n{fmt_rows(allp[place])}" for place in PLACE_ORDER
+                )
+                text = f"Остатки: <b>{KIND_LABEL[kind]}</b>\n\n{blocks}"
+                await q.edit_message_text(text, parse_mode=ParseMode.HTML, reply_markup=_main_kb(update))
+                return
+
+        case [act, "place", kind, place]:
+            context.user_data["act"] = act
+            context.user_data["kind"] = kind
+            context.user_data["place"] = place
+
+            if act == "add":
+                await q.edit_message_text(
+                    f"Добавление: <b>{KIND_LABEL[kind]}</b> → <b>{PLACE_LABEL[place]}</b>\n\n"
+                    "Напиши названия одним сообщением.\n"
+                    "Можно несколько строк:\nСуп\nРагу",
+                    parse_mode=ParseMode.HTML,
+                    reply_markup=kb_back("add:back_place"),
+                )
+                return
+
+            if act == "del":
+                rows = await asyncio.to_thread(db_list, kind, place)
+                context.user_data["del_ids"] = tuple(r[0] for r in rows)
+                msg = (
+                    f"Удаление: <b>{KIND_LABEL[kind]}</b> → <b>{PLACE_LABEL[place]}</b>\n\n"
+                    f"{fmt_rows(rows)}\n\n"
+                    "Отправь номер(а) строк для удаления.\n"
+                    "Примеры: <b>2</b> или <b>1 4</b> или <b>1, 4</b>\n"
+                    "/cancel — отмена."
+                )
+                await q.edit_message_text(msg, parse_mode=ParseMode.HTML, reply_markup=kb_back("del:back_place"))
+                return
+
+            if act == "move":
+                await q.edit_message_text(
+                    "Куда переложить?",
+                    reply_markup=kb_move_dest(kind, place),
+                )
+                return
+
+            if act == "edit":
+                rows = await asyncio.to_thread(db_list, kind, place)
+                context.user_data["edit_ids"] = tuple(r[0] for r in rows)
+                msg = (
+                    f"Редактирование: <b>{KIND_LABEL[kind]}</b> → <b>{PLACE_LABEL[place]}</b>\n\n"
+                    f"{fmt_rows(rows)}\n\n"
+                    "Что редактируем?"
+                )
+                await q.edit_message_text(msg, parse_mode=ParseMode.HTML, reply_markup=kb_edit_field())
+                return
 
     await q.edit_message_text(WELCOME_TEXT, reply_markup=_main_kb(update))
 
@@ -622,8 +680,8 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Недостаточно прав.", reply_markup=kb_back("edit:back_place"))
             return
         field = context.user_data.get("edit_field")
-        rows = context.user_data.get("edit_rows", [])
-        if field and rows:
+        ids = context.user_data.get("edit_ids", ())
+        if field and ids:
             parts = text.split()
             if len(parts) < 2 or not parts[0].isdigit():
                 await update.message.reply_text(
@@ -632,19 +690,19 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
                 return
             idx = int(parts[0])
-            if idx < 1 or idx > len(rows):
+            if idx < 1 or idx > len(ids):
                 await update.message.reply_text(
-                    f"Сейчас доступно 1..{len(rows)}. Попробуй снова.",
+                    f"Сейчас доступно 1..{len(ids)}. Попробуй снова.",
                     reply_markup=kb_back("edit:back_place"),
                 )
                 return
-            item_id = rows[idx - 1][0]
+            item_id = ids[idx - 1]
             if field == "text":
                 new_text = " ".join(parts[1:]).strip()
                 if not new_text:
                     await update.message.reply_text("Новое название пустое.", reply_markup=kb_back("edit:back_place"))
                     return
-                db_update_text(item_id, new_text)
+                await asyncio.to_thread(db_update_text, item_id, new_text)
             elif field == "date":
                 new_date = " ".join(parts[1:]).strip()
                 dt = _parse_ddmmyyyy(new_date)
@@ -654,15 +712,17 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                         parse_mode=ParseMode.HTML,
                     )
                     return
-                db_update_created_at(item_id, dt)
+                await asyncio.to_thread(db_update_created_at, item_id, dt)
             else:
                 await update.message.reply_text("Сначала выбери, что редактировать.", reply_markup=kb_back("edit:back_place"))
                 return
 
+            # A date edit reorders the list, so unlike delete/move this snapshot is re-queried
             kind = context.user_data.get("kind")
             place = context.user_data.get("place")
             if kind and place:
-                context.user_data["edit_rows"] = db_list(kind, place)
+                rows = await asyncio.to_thread(db_list, kind, place)
+                context.user_data["edit_ids"] = tuple(r[0] for r in rows)
             await update.message.reply_text("Готово. Можно редактировать дальше.", reply_markup=kb_back("edit:back_place"))
             return
 
@@ -678,19 +738,18 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Move items
-    if context.user_data.get("act") == "move" and "move_rows" in context.user_data:
-        rows = context.user_data.get("move_rows", [])
-        nums = parse_delete_nums(text)
-        if not nums:
+    if context.user_data.get("act") == "move" and "move_ids" in context.user_data:
+        ids = context.user_data.get("move_ids", ())
+        valid = parse_delete_nums(text, len(ids))
+        if valid is None:
             await update.message.reply_text(
                 "Отправь номер(а) строк для переноса. Примеры: 2 или 1 4 или 1, 4",
                 reply_markup=_main_kb(update),
             )
             return
-        valid = [n for n in nums if 1 <= n <= len(rows)]
         if not valid:
             await update.message.reply_text(
-                f"Сейчас доступно 1..{len(rows)}. Попробуй снова.",
+                f"Сейчас доступно 1..{len(ids)}. Попробуй снова.",
                 reply_markup=_main_kb(update),
             )
             return
@@ -701,16 +760,10 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         now = datetime.now(tz=TZ)
-        moved = 0
-        for n in sorted(valid, reverse=True):
-            item_id = rows[n - 1][0]
-            db_update_place_and_date(item_id, to_place, now)
-            moved += 1
-
-        kind = context.user_data.get("kind")
-        from_place = context.user_data.get("move_from")
-        if kind and from_place:
-            context.user_data["move_rows"] = db_list(kind, from_place)
+        moved = await asyncio.to_thread(db_move_many, [ids[n - 1] for n in valid], to_place, now)
+        # Same as delete: moved rows leave the source place, so drop them without a re-query
+        gone = set(valid)
+        context.user_data["move_ids"] = tuple(i for n, i in enumerate(ids, start=1) if n not in gone)
 
         await update.message.reply_text(
             f"Переложил ✅ {moved} шт. (дата обновлена)",
@@ -729,42 +782,38 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=kb_back("add:back_place"),
             )
             return
-        for t in items:
-            db_add(kind, place, t)
-        context.user_data.clear()
+        await asyncio.to_thread(db_add_many, kind, place, items)
+        _reset_flow(context.user_data)
         await update.message.reply_text(f"Добавил ✅ {len(items)} шт.", reply_markup=_main_kb(update))
         return
 
     # Manual DEL
-    if context.user_data.get("act") == "del" and "del_rows" in context.user_data:
-        nums = parse_delete_nums(text)
-        rows = context.user_data.get("del_rows", [])
+    if context.user_data.get("act") == "del" and "del_ids" in context.user_data:
+        ids = context.user_data.get("del_ids", ())
+        valid = parse_delete_nums(text, len(ids))
 
-        if not nums:
+        if valid is None:
             await update.message.reply_text(
                 "Для удаления отправь номер(а) строк.\nПримеры: 2 или 1 4 или 1, 4\n/cancel — отмена.",
                 reply_markup=kb_back("del:back_place"),
             )
             return
 
-        valid = [n for n in nums if 1 <= n <= len(rows)]
         if not valid:
             await update.message.reply_text(
-                f"Сейчас доступно 1..{len(rows)}. Попробуй снова.",
+                f"Сейчас доступно 1..{len(ids)}. Попробуй снова.",
                 reply_markup=kb_back("del:back_place"),
             )
             return
 
-        for n in sorted(valid, reverse=True):
-            item_id = rows[n - 1][0]
-            db_delete(item_id)
+        deleted = await asyncio.to_thread(db_delete_many, [ids[n - 1] for n in valid])
 
-        kind = context.user_data.get("kind")
-        place = context.user_data.get("place")
-        context.user_data["del_rows"] = db_list(kind, place)
+        # Remaining rows are known without a re-query: drop the deleted positions
+        gone = set(valid)
+        context.user_data["del_ids"] = tuple(i for n, i in enumerate(ids, start=1) if n not in gone)
 
         await update.message.reply_text(
-            f"Удалил ✅ {len(valid)} шт.",
+            f"Удалил ✅ {deleted} шт.",
             reply_markup=kb_back("del:back_place"),
         )
         return
@@ -772,24 +821,21 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Query: "есть ли ..."
     query = _extract_query(text)
     if query:
-        rows = db_all_raw_with_date()
+        rows = await asyncio.to_thread(db_all_raw_with_date)
         matches = _find_query_matches(rows, query)
         if not matches:
             await update.message.reply_text("Похоже, этого нет в списке.", reply_markup=_main_kb(update))
             return
 
-        lines = ["Нашёл:"]
-        for _id, kind, place, item_text, created_at in matches[:20]:
-            date_str = _fmt_date(created_at)
-            extra = f" — {date_str}" if date_str else ""
-            lines.append(
-                f"• {esc(item_text)} — {PLACE_LABEL.get(place, place)} — {KIND_LABEL.get(kind, kind)}{extra}"
-            )
-        await update.message.reply_text("\n".join(lines), parse_mode=ParseMode.HTML, reply_markup=_main_kb(update))
+        found = "\n".join(
+            _fmt_found_row(kind, place, item_text, created_at)
+            for _id, kind, place, item_text, created_at in matches[:20]
+        )
+        await update.message.reply_text(f"Нашёл:\n{found}", parse_mode=ParseMode.HTML, reply_markup=_main_kb(update))
         return
 
     # AI free-text
-    ai = ai_parse_text(text)
+    ai = await ai_parse_text(text)
     action = ai.get("action", "unknown")
 
     if action == "add":
@@ -803,14 +849,10 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Не понял, что добавить. Используй кнопки 👇", reply_markup=_main_kb(update))
             return
 
-        kind = kind if kind in VALID_KINDS else "ingredient"
-        place = place if place in VALID_PLACES else "fridge"
+        kind = kind if isinstance(kind, str) and kind in VALID_KINDS else "ingredient"
+        place = place if isinstance(place, str) and place in VALID_PLACES else "fridge"
 
-        added = 0
-        for i in items:
-            if isinstance(i, str) and i.strip():
-                db_add(kind, place, i.strip())
-                added += 1
+        added = await asyncio.to_thread(db_add_many, kind, place, [i for i in items if isinstance(i, str)])
 
         await update.message.reply_text(
             f"🤖 Добавил {added} шт.\n{KIND_LABEL[kind]} → {PLACE_LABEL[place]}",
@@ -831,26 +873,25 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("Не понял, что удалить. Используй кнопки 👇", reply_markup=_main_kb(update))
             return
 
-        rows = db_all_raw()
-
         place_hint = ai.get("place")
         kind_hint = ai.get("kind")
-        if place_hint in VALID_PLACES:
-            rows = [r for r in rows if r[2] == place_hint]
-        if kind_hint in VALID_KINDS:
-            rows = [r for r in rows if r[1] == kind_hint]
+        rows = await asyncio.to_thread(
+            db_list_filtered,
+            kind=kind_hint if isinstance(kind_hint, str) and kind_hint in VALID_KINDS else None,
+            place=place_hint if isinstance(place_hint, str) and place_hint in VALID_PLACES else None,
+        )
 
-        deleted = 0
+        to_delete = []
         ambiguous = []
 
-        for qtxt in queries:
-            matches = find_matches(rows, qtxt)
+        for qtxt, matches in zip(queries, find_matches_many(rows, queries)):
             if len(matches) == 1:
-                db_delete(int(matches[0][0]))
-                deleted += 1
+                to_delete.append(int(matches[0][0]))
             elif len(matches) > 1:
                 ambiguous.append((qtxt, matches))
 
+        deleted = await asyncio.to_thread(db_delete_many, to_delete)
+
         if ambiguous:
             msg = ["Часть позиций не удалил — нужно уточнить:"]
             for qtxt, matches in ambiguous:
@@ -864,6 +905,9 @@ async def on_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"🤖 Удалил {deleted} шт.", reply_markup=_main_kb(update))
         return
 
+    # In groups unrecognised text is ordinary chatter: stay silent instead of spending send quota
+    if not _is_private(update):
+        return
     await update.message.reply_text("Не понял. Используй кнопки 👇", reply_markup=_main_kb(update))
 
 
@@ -920,15 +964,61 @@ async def on_photo(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # ================= ERROR HANDLER =================
 async def on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
-    print("ERROR:", context.error)
+    logger.error("Update failed: %s", context.error, exc_info=context.error)
 
 
 # ================= APP BUILDER =================
+class _PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Up to max_concurrent_updates updates at once, but one chat's updates strictly in order:
+    the del/move/edit/photo flows read and rewrite user_data across awaits.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._pending: Dict[int, int] = {}
+
+    async def do_process_update(self, update, coroutine) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await coroutine
+            return
+        key = chat.id
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._pending[key] = self._pending.get(key, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            # Drop the lock once nobody holds or waits on it, so the dict doesn't grow per chat
+            self._pending[key] -= 1
+            if not self._pending[key]:
+                del self._pending[key]
+                del self._locks[key]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+
 def build_app() -> Application:
-    print("OPENAI_API_KEY present:", bool(OPENAI_API_KEY))
+    logger.info("OPENAI_API_KEY present: %s", bool(OPENAI_API_KEY))
     db_init()
 
-    app = Application.builder().token(BOT_TOKEN).build()
+    # Slow DB/AI calls in one chat must not stall everyone else; bounded by CONCURRENT_UPDATES
+    # (PG_POOL_MAX by default on Postgres) so a burst doesn't outrun the connection pool
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(
+            _PerChatUpdateProcessor(CONCURRENT_UPDATES) if CONCURRENT_UPDATES > 1 else False
+        )
+        .post_shutdown(_on_shutdown)
+        .build()
+    )
 
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("cancel", cancel_cmd))
@@ -948,7 +1038,7 @@ def build_app() -> Application:
 
     if MORNING_CHAT_ID:
         if app.job_queue is None:
-            print("JobQueue not available: install python-telegram-bot[job-queue]")
+            logger.warning("JobQueue not available: install python-telegram-bot[job-queue]")
         else:
             app.job_queue.run_daily(
                 morning_job,
@@ -958,7 +1048,7 @@ def build_app() -> Application:
 
     if EVENING_CHAT_ID:
         if app.job_queue is None:
-            print("JobQueue not available: install python-telegram-bot[job-queue]")
+            logger.warning("JobQueue not available: install python-telegram-bot[job-queue]")
         else:
             app.job_queue.run_daily(
                 evening_job,
@@ -966,6 +1056,9 @@ def build_app() -> Application:
                 name="evening_reminder",
             )
 
+    if app.job_queue is not None:
+        app.job_queue.run_repeating(db_optimize_job, interval=15 * 60, first=15 * 60, name="db_optimize")
+
     app.add_error_handler(on_error)
 
     return app
@@ -1,6 +1,12 @@
-﻿from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+﻿from functools import lru_cache
 
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
+# Markups are immutable in PTB, so keyboards for the small set of valid inputs are cached.
+# Bounded caches: action/kind come from callback data, which a client can forge.
+
+
+@lru_cache(maxsize=None)
 def kb_main(is_admin: bool = False):
     # 2 столбца, 3 ряда (без админ-кнопки)
     rows = [
@@ -27,6 +33,7 @@ def kb_main(is_admin: bool = False):
     return InlineKeyboardMarkup(rows)
 
 
+@lru_cache(maxsize=32)
 def kb_kind(action: str):
     return InlineKeyboardMarkup([
         [
@@ -37,6 +44,7 @@ def kb_kind(action: str):
     ])
 
 
+@lru_cache(maxsize=64)
 def kb_place(action: str, kind: str):
     return InlineKeyboardMarkup([
         [
@@ -51,6 +59,7 @@ def kb_place(action: str, kind: str):
     ])
 
 
+@lru_cache(maxsize=None)
 def kb_photo_kind():
     # Выбор типа для фото-распознавания
     return InlineKeyboardMarkup([
@@ -62,6 +71,7 @@ def kb_photo_kind():
     ])
 
 
+@lru_cache(maxsize=None)
 def kb_photo_wait_back():
     # На шаге "пришлите фото" должна быть одна кнопка "назад"
     return InlineKeyboardMarkup([
@@ -69,6 +79,7 @@ def kb_photo_wait_back():
     ])
 
 
+@lru_cache(maxsize=None)
 def kb_confirm_photo():
     return InlineKeyboardMarkup([
         [
@@ -79,6 +90,7 @@ def kb_confirm_photo():
     ])
 
 
+@lru_cache(maxsize=None)
 def kb_edit_field():
     return InlineKeyboardMarkup([
         [
@@ -90,6 +102,7 @@ def kb_edit_field():
     ])
 
 
+@lru_cache(maxsize=64)
 def kb_move_dest(kind: str, from_place: str):
     buttons = []
     if from_place != "fridge":
@@ -112,6 +125,7 @@ def kb_move_dest(kind: str, from_place: str):
     return InlineKeyboardMarkup(rows)
 
 
+@lru_cache(maxsize=32)
 def kb_back(callback_data: str):
     return InlineKeyboardMarkup([
         [InlineKeyboardButton("⬅️ Назад", callback_data=callback_data)]
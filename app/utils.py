@@ -1,17 +1,43 @@
+import re
+from functools import lru_cache
+from itertools import islice
+
+# Item names repeat across every list render; a cache hit beats even the three C-level replaces
+@lru_cache(maxsize=4096)
 def esc(s: str) -> str:
     return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
 
 def parse_add_lines(text: str):
-    return [ln.strip() for ln in text.splitlines() if ln.strip()]
+    return list(filter(None, map(str.strip, text.splitlines())))
+
+# Whole tokens only (separated by whitespace , ;): "1-3", "2шт" or "10.5" must not act on rows
+_NUM_RE = re.compile(r"(?<![^\s,;])\d+(?![^\s,;])")
+# Upper bound on numbers taken from one message; a long paste of digits can't blow up the set
+MAX_NUMS = 1000
+
+# Row numbers within 1..count, deduped into buckets and returned ascending in one pass;
+# None when the text has no numbers at all (callers word that case differently)
+def parse_delete_nums(text: str, count: int):
+    seen = bytearray(count + 1)
+    max_len = len(str(count))
+    found = False
+    for m in islice(_NUM_RE.finditer(text), MAX_NUMS):
+        found = True
+        # Longer than count's digits is out of range anyway; also keeps int() off huge digit runs
+        tok = m[0].lstrip("0") or "0"
+        if len(tok) > max_len:
+            continue
+        n = int(tok)
+        if 1 <= n <= count:
+            seen[n] = 1
+    if not found:
+        return None
+    return [n for n in range(1, count + 1) if seen[n]]
 
-def parse_delete_nums(text: str):
-    cleaned = text.replace(",", " ").replace(";", " ")
-    parts = [p.strip() for p in cleaned.split() if p.strip()]
-    nums = []
-    for p in parts:
-        if p.isdigit():
-            nums.append(int(p))
-    return sorted(set(nums))
+# ё→е, drop apostrophes, hyphen→space; applied after lower(). ъ/ь are kept: dropping them
+# turns "соль" into "сол", a substring of "соленые", and AI delete would widen to other rows
+_NORM_TABLE = str.maketrans({"ё": "е", "'": "", "’": "", "-": " "})
+_WS_RE = re.compile(r"\s+")
 
 def norm(s: str) -> str:
-    return " ".join(s.lower().strip().split())
+    return _WS_RE.sub(" ", s.lower().translate(_NORM_TABLE)).strip()
@@ -1,8 +1,37 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+from app.config import BOT_TOKEN, LOG_LEVEL, PORT, WEBHOOK_SECRET, WEBHOOK_URL
 from app.handlers import build_app
 
+
+def setup_logging() -> None:
+    # Handlers only enqueue records; a background thread does the actual stdout writes
+    q = queue.SimpleQueue()
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    listener = QueueListener(q, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logging.basicConfig(level=LOG_LEVEL, handlers=[QueueHandler(q)])
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
 def main():
+    setup_logging()
     app = build_app()
-    app.run_polling(allowed_updates=None, drop_pending_updates=True)
+    if WEBHOOK_URL:
+        app.run_webhook(
+            listen="0.0.0.0",
+            port=PORT,
+            url_path=BOT_TOKEN,
+            webhook_url=f"{WEBHOOK_URL}/{BOT_TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+        )
+    else:
+        app.run_polling(allowed_updates=None, drop_pending_updates=True)
 
 if __name__ == "__main__":
     main()